@@ -1,31 +1,13 @@
 import os
-import sys
-import fal_client
-import yt_dlp
-import unicodedata
-import re
-import shutil
-import json
-from dotenv import load_dotenv
 import time
-import streamlit as st
-import io
-import contextlib
 import concurrent.futures
-from datetime import datetime, timedelta
-
-# -------------------- Utility Functions --------------------
-
-def append_log(message: str):
-    """Append a timestamped message to process logs."""
-    if "logs" not in st.session_state:
-        st.session_state["logs"] = ""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    st.session_state["logs"] += f"{timestamp} - {message}\n"
-
-
-def format_time(seconds):
-    return str(timedelta(seconds=int(seconds))).split('.')[0]
+from datetime import datetime
+import orjson
+import streamlit as st
+from logger import append_log, clear_logs, get_logs, with_session_logs
+from utils import audio_fingerprint, chunks_to_columns, format_size, format_time, get_episode_name, stat_or_none
+from transcriber import fetch_info, download_audio, preload_fal_client, transcribe_in_batches
+from file_manager import save_transcript, load_cached_transcript, store_cached_transcript, clear_transcript_cache
 
 # -------------------- Provided Components --------------------
 
@@ -39,226 +21,219 @@ def setup_fal_api():
         st.error("FAL_KEY not found in st.secrets. Please add it to your secrets file.")
         raise e
 
-def sanitize_filename(filename):
-    """
-    Sanitize filename to handle special characters and encoding issues.
-    """
-    filename = re.sub(r'\/podcast\/', '', filename)
-    filename = re.sub(r'id\d+', '', filename)
-    filename = filename.split('?')[0]
-    filename = filename.split('/')[-1]
-    filename = unicodedata.normalize('NFKD', filename)
-    filename = filename.encode('ASCII', 'ignore').decode('ASCII')
-    filename = re.sub(r'[^\w\s-]', '', filename)
-    filename = re.sub(r'\s+', '_', filename.strip())
-    return filename
+@st.cache_resource(show_spinner=False)
+def setup_fal_once():
+    """Run setup_fal_api once per process instead of on every rerun.
+    Failures raise and are therefore not cached."""
+    return setup_fal_api()
 
-def get_episode_name(url, fallback_title=None):
-    """
-    Extract episode name from URL or use fallback title.
+# Weight of the newest sample in the download speed average.
+SPEED_EWMA_ALPHA = 0.2
+
+def run_pipeline(url, progress):
+    """Extract metadata, download and transcribe a URL; meant to run in a worker thread.
+
+    ``progress`` is a dict shared with the caller. ``progress["stage"]`` moves
+    from "metadata" to "download" (with the info dict stored under
+    ``progress["info"]``) and then to "transcribe" once the audio is on disk.
+    While downloading, ``progress["download"]`` holds ``(downloaded, total, speed)``
+    in bytes and bytes/s, measured on the download itself; ``total`` and
+    ``speed`` are None until yt-dlp knows them.
+    While transcribing, ``progress["partial"]`` maps each finished batch's
+    start offset to its text.
+    Returns ``(info_dict, audio_file, result)``; ``audio_file`` is None if the
+    download failed.
     """
     try:
-        if 'podcast' in url:
-            path = url.split('/')
-            for segment in path:
-                if len(segment) > 10:
-                    cleaned = segment.replace('-', ' ')
-                    if not cleaned.startswith('id') and not cleaned.isdigit():
-                        return sanitize_filename(segment)
-        if fallback_title:
-            return sanitize_filename(fallback_title)
-        return 'transcript'
+        info_dict = fetch_info(url)
     except Exception as e:
-        append_log(f"Error extracting episode name: {str(e)}")
-        return 'transcript'
+        append_log(f"Metadata extraction error: {str(e)}")
+        info_dict = None
+    progress["info"] = info_dict
+    progress["stage"] = "download"
 
-def save_transcript(result, url=None, title=None):
-    """Save transcription result to episode-named file."""
-    if result and 'text' in result:
-        try:
-            episode_name = get_episode_name(url, title)
-            transcript_filename = f"{episode_name}.txt"
-            json_filename = f"{episode_name}_full.json"
-            with open(transcript_filename, 'w', encoding='utf-8') as f:
-                f.write(result['text'])
-            append_log(f"Transcript saved successfully to {transcript_filename}")
-            with open(json_filename, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            append_log(f"Full transcript data saved to {json_filename}")
-        except Exception as e:
-            append_log(f"Error saving transcript: {str(e)}")
-    else:
-        append_log("Error: No valid transcription result to save")
+    # Download speed is an exponentially weighted moving average of the rate
+    # between consecutive hook calls: O(1) per block and no sample window.
+    last_time = last_bytes = speed = None
 
-def download_audio(url):
-    """Download audio from URL using yt-dlp with encoding handling."""
-    try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-            title = info_dict.get('title', 'video')
-        safe_title = sanitize_filename(title)
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': f'{safe_title}.%(ext)s',
-            'restrict_filenames': True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-            final_filename = f"{safe_title}.mp3"
-            if os.path.exists(final_filename):
-                return final_filename
-            else:
-                append_log(f"Error: Expected output file {final_filename} not found")
-                return None
-    except Exception as e:
-        append_log(f"Download error: {str(e)}")
-        return None
+    def on_download(status):
+        nonlocal last_time, last_bytes, speed
+        total = status.get("total_bytes") or status.get("total_bytes_estimate")
+        if status.get("status") == "downloading":
+            downloaded = status.get("downloaded_bytes", 0)
+            now = time.time()
+            if last_time is not None and now > last_time and downloaded >= last_bytes:
+                rate = (downloaded - last_bytes) / (now - last_time)
+                speed = rate if speed is None else SPEED_EWMA_ALPHA * rate + (1 - SPEED_EWMA_ALPHA) * speed
+            last_time, last_bytes = now, downloaded
+            progress["download"] = (downloaded, total, speed)
+        elif status.get("status") == "finished" and status.get("elapsed"):
+            # Bytes actually transferred; the estimate is no basis for an average.
+            size = status.get("downloaded_bytes") or status.get("total_bytes")
+            if size:
+                progress["download_speed"] = size / status["elapsed"]
 
-def on_queue_update(update):
-    """Handle transcription queue updates."""
-    if isinstance(update, fal_client.InProgress):
-        for log in update.logs:
-            try:
-                append_log(log["message"])
-            except Exception as e:
-                append_log(f"Log encoding error: {str(e)}")
+    append_log("Downloading audio...")
+    audio_file = download_audio(url, info_dict=info_dict, progress_hook=on_download)
+    if not audio_file:
+        return info_dict, None, None
+    append_log(f"Downloaded audio: {audio_file}")
+    if progress.get("download_speed"):
+        append_log(f"Average download speed: {format_size(progress['download_speed'])}/s")
+    progress["stage"] = "transcribe"
 
-def transcribe_audio(file_path: str):
-    """Transcribe audio file using Fal.ai."""
-    try:
-        if not os.path.exists(file_path):
-            append_log(f"Error: Input file {file_path} does not exist")
-            return None
-        file_path = os.path.abspath(file_path)
-        audio_url = fal_client.upload_file(file_path)
-        append_log(f"Uploaded file URL: {audio_url}")
-        result = fal_client.subscribe(
-            "fal-ai/wizper",
-            arguments={
-                "audio_url": audio_url,
-                "task": "transcribe",
-                "chunk_level": "segment",
-                "version": "3",
-                "language": "en"
-            },
-            with_logs=True,
-            on_queue_update=on_queue_update,
-        )
-        return result
-    except Exception as e:
-        append_log(f"Transcription error: {str(e)}")
-        return None
+    # Reuse a previous transcription of the same audio if one is cached.
+    audio_key = audio_fingerprint(audio_file)
+    result = load_cached_transcript(audio_key)
+    if result:
+        append_log("Loaded transcript from cache.")
+        return info_dict, audio_file, result
+    def on_batch(start, batch_result):
+        progress["partial"][start] = batch_result.get("text", "")
 
-def transcribe_in_batches(file_path, max_size_mb=30):
-    """Transcribe audio file in batches if larger than specified size."""
-    try:
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        if file_size_mb <= max_size_mb:
-            return transcribe_audio(file_path)
-        # For simplicity, we call transcribe_audio even for larger files.
-        return transcribe_audio(file_path)
-    except Exception as e:
-        append_log(f"Batch processing error: {str(e)}")
-        return None
+    duration = info_dict.get("duration") if info_dict else None
+    result = transcribe_in_batches(audio_file, on_batch=on_batch, duration=duration, checkpoint_key=audio_key)
+    # An incomplete result is not cached, so the next run resumes from the
+    # batch checkpoint and retries only the missing batches.
+    if result and result.get("text") and not result.get("incomplete"):
+        try:
+            store_cached_transcript(audio_key, result)
+        except OSError as e:
+            append_log(f"Error caching transcript: {str(e)}")
+    return info_dict, audio_file, result
+
+def record_metadata(info_dict):
+    """Store extracted metadata in session state and log the podcast duration.
+    Returns the estimated transcription time in seconds."""
+    # Store full metadata (the entire info_dict)
+    st.session_state.metadata = info_dict
+    podcast_duration = info_dict.get('duration') if info_dict else None
+    st.session_state.audio_duration = podcast_duration
+    if podcast_duration:
+        append_log(f"Podcast Duration: {format_time(podcast_duration)}")
+        estimated_time = (podcast_duration / 3600) * 5 * 60  # in seconds
+    else:
+        append_log("Podcast duration not found.")
+        estimated_time = 120  # fallback 2 minutes
+    append_log(f"Estimated transcription time: {format_time(estimated_time)}")
+    return estimated_time
 
 # -------------------- Session State Initialization --------------------
 
+# Built once at import; every value is immutable so sessions can share them.
+DEFAULT_SESSION_STATE = {
+    "audio_file": None,
+    "transcription_result": None,
+    "download_payloads": None,
+    "metadata": None,
+    "download_error": "",
+    "transcription_error": "",
+    "processing": False,
+    "transcription_completed": False,
+    "url": "",
+    "audio_duration": None,  # in seconds
+    "completed_at": None  # datetime the current transcript finished
+}
+
 def initialize_session_state():
-    defaults = {
-        "audio_file": None,
-        "transcription_result": None,
-        "metadata": None,
-        "download_error": "",
-        "transcription_error": "",
-        "logs": "",
-        "processing": False,
-        "transcription_completed": False,
-        "url": "",
-        "audio_duration": None  # in seconds
-    }
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    for key, value in DEFAULT_SESSION_STATE.items():
+        st.session_state.setdefault(key, value)
 
 # -------------------- New Transcription Handler with Overall Progress Bar --------------------
 
 def handle_transcribe(url):
     # Reset previous state
-    st.session_state.logs = ""
+    clear_logs()
     st.session_state.transcription_result = None
+    st.session_state.download_payloads = None
     st.session_state.transcription_completed = False
+    st.session_state.completed_at = None
     st.session_state.download_error = ""
     st.session_state.transcription_error = ""
     st.session_state.total_processing_time = None
 
-    setup_fal_api()
     append_log("Starting process...")
     
     # Record overall start time
     overall_start_time = time.time()
     
+    # One status container holds every progress element, so the whole run is
+    # a single collapsible block that is marked complete or failed at the end.
+    status = st.status("Processing...", expanded=True)
     # Create an overall progress bar (0 to 100)
-    overall_progress = st.progress(0)
-    overall_progress_text = st.empty()
+    overall_progress = status.progress(0)
+    overall_progress_text = status.empty()
     
-    # --- Stage 1: Extract Metadata & Podcast Duration (0-10%) ---
+    # --- Stage 1: Metadata (0-10%), Stage 2: Download (10-30%), Stage 3: Transcription (30-90%) ---
+    # The whole pipeline runs in a worker so the script thread never blocks on
+    # yt-dlp or Fal.ai; it only polls progress["stage"] to drive the display.
     overall_progress_text.text("Extracting metadata...")
-    try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-        # Store full metadata (the entire info_dict)
-        st.session_state.metadata = info_dict
-        podcast_duration = info_dict.get('duration')
-        st.session_state.audio_duration = podcast_duration
-        if podcast_duration:
-            append_log(f"Podcast Duration: {format_time(podcast_duration)}")
-        else:
-            append_log("Podcast duration not found.")
-        title = info_dict.get('title', None)
-    except Exception as e:
-        append_log(f"Metadata extraction error: {str(e)}")
-        st.session_state.audio_duration = None
-        title = None
-    overall_progress.progress(10)
-    
-    # --- Stage 2: Download Audio (10-30%) ---
-    overall_progress_text.text("Downloading audio...")
-    append_log("Downloading audio...")
-    audio_file = download_audio(url)
-    if audio_file and os.path.exists(audio_file):
-        st.session_state.audio_file = audio_file
-        append_log(f"Downloaded audio: {audio_file}")
-    else:
+    progress = {"stage": "metadata", "info": None, "download": None, "partial": {}}
+    metadata_recorded = False
+    transcription_start = None
+    shown_download_text = None
+    # Text of finished batches is shown here while the rest are transcribed.
+    partial_preview = status.empty()
+    partial_shown = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        # fal_client is only needed after the download; import it meanwhile.
+        executor.submit(preload_fal_client)
+        # The worker can't reach st.session_state; hand it this session's log buffer.
+        future = executor.submit(with_session_logs(run_pipeline), url, progress)
+        while not future.done():
+            stage = progress["stage"]
+            if stage != "metadata" and not metadata_recorded:
+                estimated_time = record_metadata(progress["info"])
+                metadata_recorded = True
+                overall_progress.progress(10)
+                overall_progress_text.text("Downloading audio...")
+                status.update(label="Downloading audio...")
+            if stage == "download" and progress["download"]:
+                downloaded, total, speed = progress["download"]
+                fraction = min(downloaded / total, 1.0) if total else 0.0
+                if total:
+                    download_text = f"Downloading audio... {fraction:.0%}"
+                else:
+                    download_text = f"Downloading audio... {format_size(downloaded)}"
+                if speed:
+                    download_text += f" at {format_size(speed)}/s"
+                else:
+                    download_text += " (measuring speed...)"
+                # Only send the browser an update when the shown value changes.
+                if download_text != shown_download_text:
+                    shown_download_text = download_text
+                    overall_progress.progress(10 + int(fraction * 20))  # 10 to 30%
+                    overall_progress_text.text(download_text)
+            if stage == "transcribe":
+                if transcription_start is None:
+                    transcription_start = time.time()
+                    status.update(label="Transcribing...")
+                elapsed = time.time() - transcription_start
+                transcription_progress = min(elapsed / estimated_time, 1.0)
+                overall_progress.progress(30 + int(transcription_progress * 60))  # 30 to 90%
+                remaining = max(estimated_time - elapsed, 0)
+                overall_progress_text.text(f"Transcribing... Estimated time remaining: {int(remaining)} seconds")
+                # Copy first: the worker adds batches while we read.
+                partial = dict(progress["partial"])
+                if len(partial) != partial_shown:
+                    partial_shown = len(partial)
+                    # Batches finish out of order; show them in audio order.
+                    partial_text = " ".join(partial[start] for start in sorted(partial))
+                    partial_preview.container(height=300, border=True).text(partial_text)
+            # Poll at ~10 Hz while downloading so the bar tracks the transfer.
+            concurrent.futures.wait([future], timeout=0.1 if stage == "download" else 1)
+        info_dict, audio_file, result = future.result()
+    partial_preview.empty()
+    if not metadata_recorded:
+        record_metadata(info_dict)
+    title = info_dict.get('title', None) if info_dict else None
+    if not audio_file:
         st.session_state.download_error = "Failed to download audio file."
         append_log(st.session_state.download_error)
         overall_progress_text.text(st.session_state.download_error)
+        status.update(label=st.session_state.download_error, state="error")
         return None
-    overall_progress.progress(30)
-    
-    # --- Stage 3: Transcription (30-90%) ---
-    if st.session_state.audio_duration:
-        estimated_time = (st.session_state.audio_duration / 3600) * 5 * 60  # in seconds
-    else:
-        estimated_time = 120  # fallback 2 minutes
-    append_log(f"Estimated transcription time: {format_time(estimated_time)}")
-    overall_progress_text.text("Transcribing audio...")
-    
-    transcription_start = time.time()
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future = executor.submit(transcribe_in_batches, st.session_state.audio_file)
-        while not future.done():
-            elapsed = time.time() - transcription_start
-            transcription_progress = min(elapsed / estimated_time, 1.0)
-            overall_progress.progress(30 + int(transcription_progress * 60))  # 30 to 90%
-            remaining = max(estimated_time - elapsed, 0)
-            overall_progress_text.text(f"Transcribing... Estimated time remaining: {int(remaining)} seconds")
-            time.sleep(1)
-        result = future.result()
+    st.session_state.audio_file = audio_file
     overall_progress.progress(90)
     overall_progress_text.text("Transcription complete!")
     
@@ -266,14 +241,33 @@ def handle_transcribe(url):
     if result and result.get("text"):
         st.session_state.transcription_result = result
         st.session_state.transcription_completed = True
+        # Captured once so the download payloads carry a stable timestamp.
+        st.session_state.completed_at = datetime.now()
         append_log("Transcription completed successfully.")
-        save_transcript(result, url=url, title=title)
+        # A partial transcript is not written out as if it were the episode's.
+        if not result.get("incomplete"):
+            try:
+                save_transcript(result, url, title)
+                append_log("Transcript saved successfully.")
+            except Exception as e:
+                append_log(f"Error saving transcript: {str(e)}")
         overall_progress.progress(100)
-        overall_progress_text.text("Process complete!")
+        if result.get("incomplete"):
+            st.session_state.transcription_error = (
+                f"Transcript is incomplete: {len(result['missing_batches'])} batches failed. "
+                "Transcribe again to retry only those."
+            )
+            append_log(st.session_state.transcription_error)
+            overall_progress_text.text(st.session_state.transcription_error)
+            status.update(label=st.session_state.transcription_error, state="error")
+        else:
+            overall_progress_text.text("Process complete!")
+            status.update(label="Process complete!", state="complete", expanded=False)
     else:
         st.session_state.transcription_error = "Transcription failed or returned empty result."
         append_log(st.session_state.transcription_error)
         overall_progress_text.text(st.session_state.transcription_error)
+        status.update(label=st.session_state.transcription_error, state="error")
     
     # Record total processing time
     st.session_state.total_processing_time = time.time() - overall_start_time
@@ -282,11 +276,71 @@ def handle_transcribe(url):
 
 # -------------------- Custom Download Buttons Using Provided Format --------------------
 
+def build_download_payloads():
+    """Build the JSON and TXT download bodies for the current transcript as bytes.
+       Only minimal metadata and the transcript are included; 'Date posted' is
+       reformatted (e.g. '20250204' becomes '2025-02-04'). Dates come from the
+       moment the transcription completed, not from when this runs."""
+    result = st.session_state.transcription_result
+    transcript_text = result.get("text", "")
+    completed_at = st.session_state.completed_at or datetime.now()
+    # Use 'upload_date' from metadata if available
+    raw_date_posted = st.session_state.metadata.get("upload_date", "")
+    if raw_date_posted and len(raw_date_posted) == 8 and raw_date_posted.isdigit():
+        formatted_date_posted = f"{raw_date_posted[:4]}-{raw_date_posted[4:6]}-{raw_date_posted[6:]}"
+    else:
+        formatted_date_posted = raw_date_posted
+
+    # Build minimal JSON structure (only podcast metadata and transcript)
+    json_data = {
+        "api": {
+            "name": "Wizper"
+        },
+        "podcast": {
+            "title": st.session_state.metadata.get("title", "Podcast Transcript"),
+            "Podcast Show": st.session_state.metadata.get("uploader", ""),
+            "url": st.session_state.url,
+            "Date posted": formatted_date_posted,
+            "Date transcribed": completed_at.strftime('%Y-%m-%d')
+        },
+        "transcript": transcript_text
+    }
+    if result.get("incomplete"):
+        json_data["incomplete"] = True
+        json_data["missing_batches"] = result.get("missing_batches", [])
+    
+    # Build TXT content including minimal metadata. Only the short header is
+    # formatted as a string; the transcript is encoded once and appended as bytes
+    # so it is never copied into an intermediate str.
+    header_lines = [
+        "Transcribed by Wizper API",
+        f"Generated on: {completed_at.strftime('%Y-%m-%d %H:%M:%S')}",
+        "",
+        "Podcast Metadata:",
+        f"Title: {st.session_state.metadata.get('title', 'Podcast Transcript')}",
+        f"Podcast Show: {st.session_state.metadata.get('uploader', '')}",
+        f"URL: {st.session_state.url}",
+        f"Date posted: {formatted_date_posted}",
+        f"Date transcribed: {completed_at.strftime('%Y-%m-%d')}",
+        "",
+        "Transcript:",
+        "",
+    ]
+    if result.get("incomplete"):
+        header_lines[-2:-2] = [
+            f"INCOMPLETE: {len(result.get('missing_batches', []))} batches failed and are missing from this transcript.",
+            "",
+        ]
+    txt_bytes = b"".join((
+        "\n".join(header_lines).encode('utf-8'),
+        transcript_text.encode('utf-8'),
+        b"\n",
+    ))
+    return orjson.dumps(json_data, option=orjson.OPT_INDENT_2), txt_bytes
+
 def create_download_buttons_custom():
-    """Create download buttons for JSON and TXT versions of the transcript using safe_title and include only minimal metadata and transcript.
-       'Date posted' is reformatted (e.g. '20250204' becomes '2025-02-04')."""
+    """Create download buttons for JSON and TXT versions of the transcript using safe_title."""
     if st.session_state.transcription_result:
-        transcript_text = st.session_state.transcription_result.get("text", "")
         # Ensure metadata exists; if not, provide defaults.
         if not st.session_state.metadata:
             st.session_state.metadata = {
@@ -294,52 +348,21 @@ def create_download_buttons_custom():
                 "title": "Podcast Transcript",
                 "uploader": "",
             }
-        # Use 'upload_date' from metadata if available
-        raw_date_posted = st.session_state.metadata.get("upload_date", "")
-        if raw_date_posted and len(raw_date_posted) == 8 and raw_date_posted.isdigit():
-            formatted_date_posted = f"{raw_date_posted[:4]}-{raw_date_posted[4:6]}-{raw_date_posted[6:]}"
-        else:
-            formatted_date_posted = raw_date_posted
+        # Build the payloads once per transcription; later reruns reuse the bytes.
+        if st.session_state.download_payloads is None:
+            st.session_state.download_payloads = build_download_payloads()
+        json_bytes, txt_bytes = st.session_state.download_payloads
 
         # Compute safe_title using get_episode_name (which returns a sanitized title)
         safe_title = get_episode_name(
             st.session_state.url, 
             st.session_state.metadata.get("title", "Podcast Transcript")
         )
-        # Build minimal JSON structure (only podcast metadata and transcript)
-        json_data = {
-            "api": {
-                "name": "Wizper"
-            },
-            "podcast": {
-                "title": st.session_state.metadata.get("title", "Podcast Transcript"),
-                "Podcast Show": st.session_state.metadata.get("uploader", ""),
-                "url": st.session_state.url,
-                "Date posted": formatted_date_posted,
-                "Date transcribed": datetime.now().strftime('%Y-%m-%d')
-            },
-            "transcript": transcript_text
-        }
-        
-        # Build TXT content including minimal metadata
-        txt_content = f"""Transcribed by Wizper API
-Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-Podcast Metadata:
-Title: {st.session_state.metadata.get("title", "Podcast Transcript")}
-Podcast Show: {st.session_state.metadata.get("uploader", "")}
-URL: {st.session_state.url}
-Date posted: {formatted_date_posted}
-Date transcribed: {datetime.now().strftime('%Y-%m-%d')}
-
-Transcript:
-{transcript_text}
-"""
         col1, col2 = st.columns(2)
         with col1:
             st.download_button(
                 "📥 Download JSON",
-                data=json.dumps(json_data, indent=2),
+                data=json_bytes,
                 file_name=f"{safe_title}_full.json",
                 mime="application/json",
                 use_container_width=True,
@@ -348,7 +371,7 @@ Transcript:
         with col2:
             st.download_button(
                 "📄 Download TXT",
-                data=txt_content,
+                data=txt_bytes,
                 file_name=f"{safe_title}.txt",
                 mime="text/plain",
                 use_container_width=True,
@@ -362,10 +385,10 @@ def main():
     st.set_page_config(page_title="Podcast Transcription App", layout="wide")
     st.title("🎙️ Podcast Transcription App")
     
-    # Load FAL API key from st.secrets automatically
-    if "FAL_KEY" in st.secrets:
-        os.environ["FAL_KEY"] = st.secrets["FAL_KEY"]
-    else:
+    # Load FAL API key from st.secrets automatically (once per process)
+    try:
+        setup_fal_once()
+    except Exception:
         st.sidebar.error("FAL API key not found in secrets. Please add it to your secrets file.")
         st.stop()
     
@@ -375,6 +398,11 @@ def main():
     2. **Transcribe:** Click the button below to download and transcribe.
     3. **View & Download:** After transcription, view the transcript and download the results.
     """)
+    # Forces the next run of any URL to re-extract metadata and re-transcribe.
+    if st.sidebar.button("Clear cache"):
+        fetch_info.clear()
+        removed = clear_transcript_cache()
+        st.sidebar.success(f"Cache cleared ({removed} cached transcripts removed).")
     
     initialize_session_state()
     
@@ -390,31 +418,36 @@ def main():
             else:
                 st.session_state.url = url
                 result = handle_transcribe(url)
-                if result and result.get("text"):
+                if result and result.get("incomplete"):
+                    st.warning(st.session_state.transcription_error)
+                elif result and result.get("text"):
                     st.success("Transcription completed successfully!")
                 elif st.session_state.transcription_error:
                     st.error(st.session_state.transcription_error)
         # Transcript preview appears below the input and messages.
         if st.session_state.transcription_result and st.session_state.transcription_result.get("text"):
             st.subheader("Transcript Preview")
-            st.text_area("", st.session_state.transcription_result.get("text", ""), height=300)
+            # Read-only container: no widget state to track for the transcript text.
+            with st.container(height=300, border=True):
+                st.text(st.session_state.transcription_result.get("text", ""))
+            # Segment table is only built on request; st.dataframe virtualizes rows,
+            # so only the visible ones reach the browser.
+            chunks = st.session_state.transcription_result.get("chunks")
+            if chunks and st.toggle("Show timestamped segments"):
+                st.dataframe(chunks_to_columns(chunks), use_container_width=True, hide_index=True)
     
     with col_status:
         st.subheader("Status")
-        if st.session_state.audio_file:
+        audio_stat = stat_or_none(st.session_state.audio_file) if st.session_state.audio_file else None
+        if audio_stat:
             st.info(f"File: {os.path.basename(st.session_state.audio_file)}")
-            try:
-                size = os.path.getsize(st.session_state.audio_file)
-                size_mb = size / (1024 * 1024)
-                st.info(f"Size: {size_mb:.2f} MB")
-            except Exception:
-                pass
+            st.info(f"Size: {format_size(audio_stat.st_size)}")
         if st.session_state.audio_duration:
             st.info(f"Podcast Duration: {format_time(st.session_state.audio_duration)}")
         if st.session_state.transcription_completed:
             create_download_buttons_custom()
         st.subheader("Process Logs")
-        st.text_area("", st.session_state.logs, height=200)
+        st.text_area("", get_logs(), height=200)
 
 if __name__ == '__main__':
     main()
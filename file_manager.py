@@ -1,8 +1,36 @@
 # file_manager.py
-import json
-from utils import get_episode_name
+import os
+import tempfile
+import time
+import orjson
+from utils import get_episode_name, get_model_meta
 
-def save_transcript(result: dict, url: str, title: str, metadata: dict) -> None:
+# Transcription results cached on disk, keyed by the audio fingerprint.
+TRANSCRIPT_CACHE_DIR = os.path.expanduser('~/.cache/transcriber_wiz')
+# Cached transcripts older than this are ignored and replaced.
+TRANSCRIPT_CACHE_TTL = 7 * 24 * 60 * 60
+
+JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Write data to path via a temporary file in the same directory that is
+    renamed into place, so readers never see a partially written file.
+    data is handed to a single write() call, which bypasses Python's buffer.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        # mkstemp creates the file owner-only; use the usual permissions.
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_transcript(result: dict, url: str, title: str, metadata: dict = None) -> None:
     """
     Save the transcription result in both TXT and JSON formats.
     The TXT file includes human-readable metadata.
@@ -12,18 +40,107 @@ def save_transcript(result: dict, url: str, title: str, metadata: dict) -> None:
         transcript_filename = f"{episode_name}.txt"
         json_filename = f"{episode_name}_full.json"
         
-        # Insert transcript into metadata.
+        # Metadata plus transcript, built as new dicts so the caller's
+        # metadata is left untouched.
         if metadata:
-            metadata['Transcript'] = result['text']
-            full_result = {**metadata, 'chunks': result.get('chunks', []), 'raw_response': result}
+            summary = {**metadata, 'transcript': result['text']}
+            full_result = {**summary, 'chunks': result.get('chunks', []), 'model_meta': get_model_meta(result)}
         else:
             full_result = result
 
-        with open(transcript_filename, 'w', encoding='utf-8') as f:
-            # Save a human-readable version.
-            if metadata:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-            else:
-                f.write(result['text'])
-        with open(json_filename, 'w', encoding='utf-8') as f:
-            json.dump(full_result, f, ensure_ascii=False, indent=2)
+        # Save a human-readable version. orjson produces UTF-8 bytes directly.
+        if metadata:
+            write_atomic(transcript_filename, orjson.dumps(summary, option=JSON_OPTIONS))
+        else:
+            write_atomic(transcript_filename, result['text'].encode('utf-8'))
+        write_atomic(json_filename, orjson.dumps(full_result, option=JSON_OPTIONS))
+
+def load_cached_transcript(key: str) -> dict:
+    """
+    Return the cached transcription result for an audio fingerprint, or None
+    on a miss or when the entry is older than TRANSCRIPT_CACHE_TTL.
+    """
+    path = os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, 'rb') as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > TRANSCRIPT_CACHE_TTL:
+                return None
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+def store_cached_transcript(key: str, result: dict) -> None:
+    """
+    Cache a transcription result for an audio fingerprint.
+    The entry is written atomically so a partial one is never read back.
+    """
+    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+    write_atomic(os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.json"), orjson.dumps(result))
+
+def _checkpoint_path(key: str) -> str:
+    return os.path.join(TRANSCRIPT_CACHE_DIR, f"{key}.partial.jsonl")
+
+def load_batch_checkpoint(key: str) -> dict:
+    """
+    Return the batches already transcribed for an audio fingerprint by an
+    earlier, interrupted run, as {start offset: batch result}.
+    A torn line (the process died mid-write) is dropped and the file rewritten
+    without it, so the next append starts on a clean line.
+    """
+    completed = {}
+    valid_lines = []
+    torn = False
+    try:
+        with open(_checkpoint_path(key), 'rb') as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    torn = True
+                    continue
+                completed[entry['start']] = entry['result']
+                valid_lines.append(line if line.endswith(b'\n') else line + b'\n')
+    except OSError:
+        return completed
+    if torn:
+        write_atomic(_checkpoint_path(key), b''.join(valid_lines))
+    return completed
+
+def append_batch_checkpoint(key: str, start, result: dict) -> None:
+    """
+    Record one finished batch for an audio fingerprint. Each batch is a
+    single appended JSON line, flushed to disk before returning, so earlier
+    batches are never rewritten.
+    """
+    os.makedirs(TRANSCRIPT_CACHE_DIR, exist_ok=True)
+    with open(_checkpoint_path(key), 'ab') as f:
+        f.write(orjson.dumps({'start': start, 'result': result}, option=orjson.OPT_APPEND_NEWLINE))
+        f.flush()
+        os.fsync(f.fileno())
+
+def remove_batch_checkpoint(key: str) -> None:
+    """Delete the batch checkpoint for an audio fingerprint, if any."""
+    try:
+        os.remove(_checkpoint_path(key))
+    except FileNotFoundError:
+        pass
+
+def clear_transcript_cache() -> int:
+    """
+    Delete every cached transcription result and batch checkpoint.
+    Returns the number of entries removed.
+    """
+    removed = 0
+    try:
+        entries = os.scandir(TRANSCRIPT_CACHE_DIR)
+    except FileNotFoundError:
+        return 0
+    with entries:
+        for entry in entries:
+            if entry.name.endswith(('.json', '.jsonl')):
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
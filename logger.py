@@ -1,16 +1,66 @@
 # logger.py
+import contextvars
+import functools
+import threading
+from collections import deque
+from datetime import datetime
 import streamlit as st
 
+# Only the most recent lines are kept so a long session can't grow without bound.
+MAX_LOG_LINES = 500
+
+# Worker threads have no Streamlit script context and can't reach
+# st.session_state; while they run, their log buffer is taken from here.
+# asyncio tasks started by a worker inherit the value.
+_ACTIVE_LOGS = contextvars.ContextVar("active_logs", default=None)
+# Guards every buffer against a render joining it while a worker appends.
+_LOGS_LOCK = threading.Lock()
+
+def _session_logs() -> deque:
+    if "logs" not in st.session_state:
+        clear_logs()
+    return st.session_state["logs"]
+
+def append_log(message: str) -> None:
+    """Append a timestamped message to the session's process logs.
+    Safe to call from worker threads wrapped with with_session_logs."""
+    logs = _ACTIVE_LOGS.get()
+    if logs is None:
+        logs = _session_logs()
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    with _LOGS_LOCK:
+        logs.append(f"{timestamp} - {message}")
+
+def clear_logs() -> None:
+    """Start a fresh, empty log buffer for the session."""
+    st.session_state["logs"] = deque(maxlen=MAX_LOG_LINES)
+
+def get_logs() -> str:
+    """Return the session's process logs as a single string for display."""
+    logs = st.session_state.get("logs", ())
+    with _LOGS_LOCK:
+        return "\n".join(logs)
+
+def with_session_logs(fn):
+    """Wrap fn so that log calls made while it runs, on any thread, go to the
+    current session's buffer. Must be called on the script thread."""
+    logs = _session_logs()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _ACTIVE_LOGS.set(logs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _ACTIVE_LOGS.reset(token)
+    return run
+
 class Logger:
-    def __init__(self):
-        # Initialize log text in session state if not already set.
-        if 'log_text' not in st.session_state:
-            st.session_state.log_text = ""
-        self.log_text = st.session_state.log_text
+    """Thin wrapper over append_log; holds no state of its own, so a single
+    module-level instance can be shared by every session."""
 
     def log(self, msg: str) -> None:
-        self.log_text += msg + "\n"
-        st.session_state.log_text = self.log_text
+        append_log(msg)
 
     def get_log(self) -> str:
-        return self.log_text
+        return get_logs()
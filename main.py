@@ -1,11 +1,11 @@
 # main.py
-import json
+import orjson
 import streamlit as st
-import yt_dlp  # used directly for extracting video info
 from config import setup_fal_api
-from utils import get_metadata
-from transcriber import download_audio, transcribe_in_batches
-from file_manager import save_transcript
+from logger import append_log, clear_logs, get_logs
+from utils import get_metadata, get_model_meta, audio_fingerprint
+from transcriber import fetch_info, download_audio, transcribe_in_batches
+from file_manager import save_transcript, load_cached_transcript, store_cached_transcript
 
 def download_and_transcribe(url: str) -> dict:
     """
@@ -16,21 +16,32 @@ def download_and_transcribe(url: str) -> dict:
     setup_fal_api()
     st.write("Starting download and transcription...")
     
-    # Extract video info and metadata.
-    with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-        info_dict = ydl.extract_info(url, download=False)
-        metadata = get_metadata(info_dict)
-        title = info_dict.get('title', None)
+    # Extract video info and metadata (cached per URL across reruns).
+    info_dict = fetch_info(url)
+    metadata = get_metadata(info_dict)
+    title = info_dict.get('title', None)
     
     # Download audio.
-    audio_file = download_audio(url)
+    audio_file = download_audio(url, info_dict=info_dict)
     if audio_file:
-        result = transcribe_in_batches(audio_file)
+        # Skip the API call entirely if this audio was transcribed before.
+        audio_key = audio_fingerprint(audio_file)
+        result = load_cached_transcript(audio_key)
+        if not result:
+            result = transcribe_in_batches(audio_file, duration=info_dict.get('duration'), checkpoint_key=audio_key)
+            # Incomplete results aren't cached so the next run resumes them.
+            if result and not result.get('incomplete'):
+                try:
+                    store_cached_transcript(audio_key, result)
+                except OSError as e:
+                    append_log(f"Error caching transcript: {str(e)}")
         if result:
-            # Save transcript files locally.
-            save_transcript(result, url, title, metadata)
+            # Save transcript files locally; a partial transcript is only
+            # shown, so it is never mistaken for the whole episode.
+            if not result.get('incomplete'):
+                save_transcript(result, url, title, metadata)
             # Combine metadata and transcript for download.
-            full_data = {**metadata, 'transcript': result["text"], 'chunks': result.get("chunks", []), 'raw_response': result}
+            full_data = {**metadata, 'transcript': result["text"], 'chunks': result.get("chunks", []), 'model_meta': get_model_meta(result)}
             return full_data
     return None
 
@@ -38,15 +49,10 @@ def main():
     st.title("Podcast Transcription App")
     st.write("This app downloads and transcribes podcast episodes from a given URL using Fal.ai and yt-dlp.")
     
-    # Log area for process updates.
-    if 'log_text' not in st.session_state:
-        st.session_state.log_text = ""
+    # Log area for process updates. Lines go to the session's bounded log
+    # buffer as they happen; the area is rendered once, when the run ends.
     log_area = st.empty()
     
-    def app_log(msg: str):
-        st.session_state.log_text += msg + "\n"
-        log_area.text_area("Logs", st.session_state.log_text, height=300)
-    
     with st.form("transcription_form"):
         url = st.text_input("Enter the URL to transcribe")
         submit_button = st.form_submit_button("Transcribe")
@@ -56,28 +62,42 @@ def main():
             st.error("Please enter a valid URL.")
         else:
             st.write("Processing... This might take a few minutes.")
+            clear_logs()
             with st.spinner("Downloading and transcribing..."):
                 full_data = download_and_transcribe(url)
+            log_area.text_area("Logs", get_logs(), height=300)
             if full_data and full_data.get('transcript'):
-                st.success("Transcription completed!")
-                st.text_area("Transcript", full_data.get('transcript'), height=300)
+                if full_data['model_meta'].get('incomplete'):
+                    st.warning("Transcript is incomplete: some batches failed. Transcribe again to retry only those.")
+                else:
+                    st.success("Transcription completed!")
+                st.subheader("Transcript")
+                with st.container(height=300, border=True):
+                    st.text(full_data.get('transcript'))
                 
                 # Prepare JSON download.
-                json_data = json.dumps(full_data, indent=2)
+                json_data = orjson.dumps(full_data, option=orjson.OPT_INDENT_2)
                 st.download_button("Download as JSON", data=json_data,
                                    file_name="transcript_full.json", mime="application/json")
                 
                 # Prepare TXT download (including metadata).
                 podcast = full_data.get('podcast', {})
+                model_meta = full_data['model_meta']
+                incomplete_note = (
+                    f"INCOMPLETE: {len(model_meta.get('missing_batches', []))} batches failed "
+                    "and are missing from this transcript.\n\n"
+                    if model_meta.get('incomplete') else ""
+                )
                 txt_content = (
                     f"Title: {podcast.get('title', '')}\n"
                     f"Podcast Show: {podcast.get('Podcast Show', '')}\n"
                     f"URL: {podcast.get('url', '')}\n"
                     f"Date posted: {podcast.get('Date posted', '')}\n"
                     f"Date transcribed: {podcast.get('Date transcribed', '')}\n\n"
+                    f"{incomplete_note}"
                     f"Transcript:\n{full_data.get('transcript')}\n"
                 )
-                st.download_button("Download as TXT", data=txt_content,
+                st.download_button("Download as TXT", data=txt_content.encode('utf-8'),
                                    file_name="transcript.txt", mime="text/plain")
             else:
                 st.error("Transcription failed or returned empty result.")
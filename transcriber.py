@@ -1,61 +1,178 @@
 # transcriber.py
+import asyncio
+import atexit
+import functools
+import importlib
 import os
+import random
+import re
+import shutil
 import subprocess
+import threading
 import time
-import yt_dlp
-import fal_client
-from utils import sanitize_filename
+import streamlit as st
+from utils import offset_chunks, sanitize_filename, stat_or_none
+from file_manager import append_batch_checkpoint, load_batch_checkpoint, remove_batch_checkpoint
 from logger import Logger
 
+# yt_dlp and fal_client are imported inside the functions that use them:
+# both are slow to import and neither is needed to render the first page.
+
 log = Logger()
 
-def download_audio(url: str) -> str:
+# Audio is sent in one request unless it is larger than FAL_MAX_UPLOAD_MB,
+# the per-file upload ceiling of Fal.ai storage; only then is it split into
+# batches.
+FAL_MAX_UPLOAD_MB = 200
+
+# A batch whose upload or transcription fails with a retryable error (see
+# _is_retryable) is retried up to BATCH_MAX_ATTEMPTS times in total, waiting
+# about BATCH_RETRY_BASE_DELAY seconds before the first retry and doubling
+# the wait after that.
+BATCH_MAX_ATTEMPTS = 3
+BATCH_RETRY_BASE_DELAY = 2
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Return True for batch failures a retry can fix: connection errors,
+    timeouts, 429 and 5xx responses. fal_client wraps HTTP errors in its own
+    exceptions, so the whole __cause__/__context__ chain is checked.
+    """
+    import httpx
+    seen = set()
+    err = error
+    while err is not None and id(err) not in seen:
+        seen.add(id(err))
+        if isinstance(err, (httpx.TransportError, asyncio.TimeoutError)):  # includes timeouts
+            return True
+        if isinstance(err, httpx.HTTPStatusError):
+            status = err.response.status_code
+            return status == 429 or status >= 500
+        err = err.__cause__ or err.__context__
+    return False
+
+# Upper bound on batches uploaded and transcribed at the same time; keep it
+# within the FAL per-key concurrency limit.
+MAX_CONCURRENT_BATCHES = 8
+
+# Guards the shared YoutubeDL instance, which is not safe to use from
+# several threads (sessions) at once.
+_YDL_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=1)
+def _ydl():
+    """
+    Return the process-wide YoutubeDL used for metadata extraction.
+    Building one loads every extractor, so it is created once and reused.
+    """
+    import yt_dlp
+    ydl = yt_dlp.YoutubeDL({
+        'quiet': True,
+        'no_warnings': True,
+        # Persist extractor data (e.g. player JS) between runs.
+        'cachedir': os.path.expanduser('~/.cache/yt-dlp'),
+        # Playlist entries are resolved only when they are downloaded.
+        'extract_flat': 'in_playlist',
+        'skip_download': True,
+    })
+    # The instance is never used as a context manager, so close it on exit.
+    atexit.register(ydl.close)
+    return ydl
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_info(url: str) -> dict:
+    """
+    Extract the yt-dlp info dictionary for a URL without downloading.
+    Results are cached per URL so Streamlit reruns don't hit the network again;
+    sanitize_info keeps the cached dict picklable.
+    """
+    ydl = _ydl()
+    with _YDL_LOCK:
+        return ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+def download_audio(url: str, info_dict: dict = None, progress_hook=None) -> str:
     """
     Download audio from the given URL using yt-dlp.
+    If info_dict from a previous extract_info call is given, it is reused
+    instead of extracting the metadata a second time.
+    progress_hook, if given, is registered as a yt-dlp progress hook and
+    receives its status dicts while the file downloads.
+    If the episode's MP3 is already on disk it is returned without downloading.
     Returns the filename of the downloaded audio.
     """
+    import yt_dlp
     try:
-        with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
-            title = info_dict.get('title', 'video')
+        if info_dict is None:
+            info_dict = fetch_info(url)
+        title = info_dict.get('title', 'video')
         safe_title = sanitize_filename(title)
+        # The extractor's id keeps same-titled episodes from different shows apart.
+        if info_dict.get('id'):
+            safe_title = f"{safe_title}-{sanitize_filename(str(info_dict['id']))}"
+        final_filename = f"{safe_title}.mp3"
+        # yt-dlp only renames the MP3 into place once extraction has finished,
+        # so a non-empty file is a complete earlier download of this episode.
+        existing = stat_or_none(final_filename)
+        if existing and existing.st_size > 0:
+            log.log(f"Reusing previously downloaded audio: {final_filename}")
+            return final_filename
         ydl_opts = {
             'format': 'bestaudio/best',
+            # Wizper resamples to 16 kHz mono anyway, so anything more is
+            # upload size with no effect on the transcript. MP3 is kept so the
+            # batch cutter can stream-copy it and upload it as audio/mpeg.
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredquality': '48',
             }],
+            'postprocessor_args': {'extractaudio': ['-ar', '16000', '-ac', '1']},
             'outtmpl': f'{safe_title}.%(ext)s',
             'restrict_filenames': True,
+            # Fetch HLS/DASH fragments in parallel and read in large chunks.
+            'concurrent_fragment_downloads': 8,
+            'http_chunk_size': 10 * 1024 * 1024,
+            'buffersize': 64 * 1024,
             # Optionally, add 'ffmpeg_location': '/usr/bin' if needed.
         }
+        if progress_hook:
+            ydl_opts['progress_hooks'] = [progress_hook]
+        # aria2c splits plain HTTP downloads over several connections, which
+        # gets around per-connection CDN throttling; use it when installed.
+        if shutil.which('aria2c'):
+            ydl_opts['external_downloader'] = {'default': 'aria2c'}
+            ydl_opts['external_downloader_args'] = {'aria2c': ['-x', '16', '-s', '16', '-k', '1M']}
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        final_filename = f"{safe_title}.mp3"
+            # Download from the already extracted info instead of re-extracting it.
+            ydl.process_ie_result(info_dict, download=True)
         if os.path.exists(final_filename):
             return final_filename
         else:
             log.log(f"Error: Expected output file {final_filename} not found")
+            fetch_info.clear(url)
             return None
     except Exception as e:
         log.log(f"Download error: {str(e)}")
+        # The cached info may hold expired format URLs; re-extract this URL
+        # on retry without dropping other URLs' (or sessions') entries.
+        fetch_info.clear(url)
         return None
 
+def preload_fal_client() -> None:
+    """
+    Import fal_client (and its HTTP stack) ahead of first use. Meant to run in
+    a spare thread while yt-dlp is busy, so the import is off the critical path.
+    """
+    importlib.import_module('fal_client')
+
 def transcribe_audio(file_path: str) -> dict:
     """
     Transcribe the audio file using Fal.ai.
     
     The function uploads the file using fal_client.upload_file() and then
-    calls fal_client.subscribe() with the following documented arguments:
-      - audio_url: URL of the uploaded file
-      - task: "transcribe"
-      - language: "en"
-      - chunk_level: "segment"
-      - version: "3"
-    
-    The on_queue_update callback logs each message from the API.
+    passes the resulting URL to transcribe_url().
     """
+    import fal_client
     try:
         if not os.path.exists(file_path):
             log.log(f"Error: Input file {file_path} does not exist")
@@ -63,114 +180,281 @@ def transcribe_audio(file_path: str) -> dict:
         file_path = os.path.abspath(file_path)
         audio_url = fal_client.upload_file(file_path)
         log.log(f"Uploaded file URL: {audio_url}")
-        
-        # Define a callback that logs update messages from the API
-        def on_queue_update(update):
-            if hasattr(update, "logs") and update.logs:
-                for item in update.logs:
-                    log.log(item.get("message", "No message"))
-            else:
-                log.log("Queue update received.")
-        
+        return transcribe_url(audio_url)
+    except Exception as e:
+        log.log(f"Transcription error: {str(e)}")
+        return None
+
+# Arguments passed to fal-ai/wizper for every request.
+WIZPER_ARGUMENTS = {
+    "task": "transcribe",
+    "language": "en",
+    "chunk_level": "segment",
+    "version": "3"
+}
+
+# Longer API log messages are cut to this many characters.
+MAX_LOG_MESSAGE_LENGTH = 512
+
+def queue_update_logger():
+    """
+    Return an on_queue_update callback for one request. It logs update
+    messages from the API, skipping empty ones, and otherwise logs the
+    request's status only when it changes, so polling doesn't flood the log.
+    """
+    last_status = None
+
+    def on_queue_update(update):
+        nonlocal last_status
+        if hasattr(update, "logs") and update.logs:
+            for item in update.logs:
+                message = item.get("message")
+                if message:
+                    log.log(str(message)[:MAX_LOG_MESSAGE_LENGTH])
+        status = type(update).__name__
+        if status != last_status:
+            last_status = status
+            log.log(f"Queue status: {status}")
+
+    return on_queue_update
+
+def transcribe_url(audio_url: str) -> dict:
+    """
+    Transcribe already uploaded audio using Fal.ai.
+    
+    Calls fal_client.subscribe() with the following documented arguments:
+      - audio_url: URL of the uploaded file
+      - task: "transcribe"
+      - language: "en"
+      - chunk_level: "segment"
+      - version: "3"
+    
+    The queue_update_logger() callback logs each message from the API.
+    """
+    import fal_client
+    try:
         result = fal_client.subscribe(
             "fal-ai/wizper",
-            arguments={
-                "audio_url": audio_url,
-                "task": "transcribe",
-                "language": "en",
-                "chunk_level": "segment",
-                "version": "3"
-            },
+            arguments={"audio_url": audio_url, **WIZPER_ARGUMENTS},
             with_logs=True,
-            on_queue_update=on_queue_update
+            on_queue_update=queue_update_logger()
         )
         return result
     except Exception as e:
         log.log(f"Transcription error: {str(e)}")
         return None
 
-def transcribe_in_batches(file_path, max_size_mb=8):
-    """Transcribe audio file in batches if larger than specified size"""
+# Batch boundaries are moved to the middle of the nearest pause within this
+# many seconds of the nominal cut, so words aren't split between batches.
+SILENCE_SEARCH_WINDOW = 30
+SILENCEDETECT_FILTER = 'silencedetect=noise=-35dB:d=0.4'
+_SILENCE_RE = re.compile(r'silence_(start|end): (-?[\d.]+)')
+
+async def _find_split_point(file_path, target, semaphore):
+    """
+    Return the middle of the silence closest to target (in seconds), looking
+    SILENCE_SEARCH_WINDOW seconds either side of it; target itself if the
+    window has no silence. Only that window is decoded.
+    """
+    window_start = max(target - SILENCE_SEARCH_WINDOW, 0)
+    async with semaphore:
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', '-hide_banner', '-nostats',
+            '-ss', str(window_start), '-t', str(2 * SILENCE_SEARCH_WINDOW), '-i', file_path,
+            '-af', SILENCEDETECT_FILTER, '-f', 'null', '-',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        _, err = await proc.communicate()
+
+    best = target
+    silence_start = None
+    # Reported times are relative to the start of the window.
+    for kind, value in _SILENCE_RE.findall(err.decode(errors='replace')):
+        if kind == 'start':
+            silence_start = float(value)
+        elif silence_start is not None:
+            middle = window_start + (silence_start + float(value)) / 2
+            if abs(middle - target) < abs(best - target):
+                best = middle
+            silence_start = None
+    return round(best, 2)
+
+async def _transcribe_batches_async(file_path, total_duration, batch_duration, max_workers, on_batch=None, completed=None, on_resumed=None):
+    """
+    Split the audio into batches of about batch_duration seconds, cutting in
+    pauses where possible, then cut, upload and transcribe every batch on one
+    event loop. At most max_workers ffmpeg or Fal.ai jobs are in flight.
+    Returns (start, result) pairs in audio order. on_batch(start, result) is
+    called as soon as each successful batch finishes, in completion order.
+    Batches whose start is in completed ({start: result}) are not sent again;
+    on_resumed(start, result) is called for each of them instead. Entries of
+    completed that match no batch start are ignored.
+    """
+    completed = completed or {}
+    import fal_client
+    # A fresh client per event loop; its HTTP pool can't be shared across loops.
+    client = fal_client.AsyncClient()
+    semaphore = asyncio.Semaphore(max_workers)
+
+    cuts = await asyncio.gather(*(
+        _find_split_point(file_path, target, semaphore)
+        for target in range(int(batch_duration), int(total_duration), int(batch_duration))
+    ))
+    starts = [0, *cuts]
+    # The last batch runs to the end of the file (no -t), whatever its length.
+    ends = [*cuts, None]
+
+    async def process_batch(start, end):
+        if start in completed:
+            if on_resumed:
+                on_resumed(start, completed[start])
+            return start, completed[start]
+        async with semaphore:
+            batch_process_start = time.time()
+            log.log(f"Processing batch starting at {start} sec")
+            
+            # Cut the batch straight into memory instead of a temporary file.
+            # -ss before -i seeks in the input instead of reading and
+            # discarding everything up to the start.
+            length = ['-t', str(end - start)] if end is not None else []
+            proc = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-v', 'error', '-ss', str(start), *length, '-i', file_path,
+                '-map', '0:a', '-acodec', 'copy', '-f', 'mp3', 'pipe:1',
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            audio, err = await proc.communicate()
+            
+            result = None
+            if proc.returncode == 0 and audio:
+                for attempt in range(1, BATCH_MAX_ATTEMPTS + 1):
+                    try:
+                        audio_url = await client.upload(audio, 'audio/mpeg')
+                        log.log(f"Uploaded batch URL: {audio_url}")
+                        result = await client.subscribe(
+                            "fal-ai/wizper",
+                            arguments={"audio_url": audio_url, **WIZPER_ARGUMENTS},
+                            with_logs=True,
+                            on_queue_update=queue_update_logger()
+                        )
+                        break
+                    except Exception as e:
+                        log.log(f"Error processing batch starting at {start} sec (attempt {attempt}/{BATCH_MAX_ATTEMPTS}): {str(e)}")
+                        if not _is_retryable(e) or attempt == BATCH_MAX_ATTEMPTS:
+                            log.log(f"Batch starting at {start} sec failed and is missing from the transcript: {str(e)}")
+                            break
+                        # Exponential backoff with jitter so batches that hit a
+                        # rate limit together don't all retry at the same moment.
+                        delay = BATCH_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                        await asyncio.sleep(delay + random.uniform(0, delay))
+
+                if on_batch and result:
+                    on_batch(start, result)
+                batch_process_end = time.time()
+                if result:
+                    log.log(f"Batch starting at {start} sec completed in {batch_process_end - batch_process_start:.2f} seconds")
+            else:
+                log.log(
+                    f"Batch starting at {start} sec could not be cut and is missing from the transcript: "
+                    f"{err.decode(errors='replace')[:MAX_LOG_MESSAGE_LENGTH]}"
+                )
+            
+            return start, result
+
+    return await asyncio.gather(*(process_batch(start, end) for start, end in zip(starts, ends)))
+
+def transcribe_in_batches(file_path, max_size_mb=FAL_MAX_UPLOAD_MB, max_workers=MAX_CONCURRENT_BATCHES, on_batch=None, duration=None, checkpoint_key=None):
+    """Transcribe audio file in one request, or in batches if it is larger
+    than max_size_mb.
+    on_batch(start, result), if given, receives each batch's raw result as soon
+    as it is transcribed (start is its offset in seconds), so callers can show
+    partial text before the whole file is done.
+    duration is the audio length in seconds if already known (e.g. from the
+    yt-dlp info dict); otherwise it is read with ffprobe.
+    With a checkpoint_key (the audio fingerprint), every finished batch is
+    checkpointed on disk and a rerun after a crash or partial failure only
+    transcribes the batches that are still missing.
+    If any batch fails for good, the merged result has "incomplete": True and
+    the failed batches' start offsets under "missing_batches"."""
     try:
         batch_start_time = time.time()
-        if not os.path.exists(file_path):
-            print(f"Error: Input file {file_path} does not exist")
+        file_stat = stat_or_none(file_path)
+        if not file_stat:
+            log.log(f"Error: Input file {file_path} does not exist")
             return None
 
-        file_size_mb = os.path.getsize(file_path) / (1024 * 1024)
-        # For files smaller than or equal to 8 MB, process as a whole
-        if file_size_mb <= max_size_mb:
-            return transcribe_audio(file_path)
-
-        import subprocess
-        from concurrent.futures import ThreadPoolExecutor, as_completed
+        file_size_mb = file_stat.st_size / (1024 * 1024)
 
         def get_audio_duration():
-            escaped_path = file_path.replace('"', '\\"')
-            cmd = f'ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "{escaped_path}"'
-            duration = subprocess.check_output(cmd, shell=True)
+            # argv list: no shell to spawn and no quoting of the file name.
+            duration = subprocess.check_output([
+                'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+                '-of', 'default=noprint_wrappers=1:nokey=1', file_path,
+            ])
             return float(duration)
 
-        total_duration = get_audio_duration()
+        # Files within the upload limit are sent as a whole
+        if file_size_mb <= max_size_mb:
+            return transcribe_audio(file_path)
+
+        # Batching needs the duration; probe the file when metadata lacks it.
+        if not duration:
+            try:
+                duration = get_audio_duration()
+            except (OSError, subprocess.CalledProcessError, ValueError) as e:
+                log.log(f"Could not determine audio duration: {str(e)}")
+                return None
+
+        total_duration = duration
         batch_duration = 8 * 60  # 8 minutes per batch
         full_transcription = {"text": "", "chunks": []}
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        text_parts = []
         
         total_batches = (int(total_duration) + int(batch_duration) - 1) // int(batch_duration)
-        print(f"\nProcessing {total_batches} batches concurrently...")
+        log.log(f"Processing {total_batches} batches concurrently...")
 
-        def process_batch(start):
-            batch_process_start = time.time()
-            batch_output = f"batch_{start}_{sanitize_filename(base_name)}.mp3"
-            print(f"Processing batch starting at {start} sec")
-            
-            escaped_input = file_path.replace('"', '\\"')
-            escaped_output = batch_output.replace('"', '\\"')
-            cut_cmd = f'ffmpeg -i "{escaped_input}" -ss {start} -t {batch_duration} -acodec copy "{escaped_output}"'
-            subprocess.call(cut_cmd, shell=True)
-            
-            result = None
-            if os.path.exists(batch_output):
+        # Batches finished by an earlier, interrupted run of the same audio.
+        completed = load_batch_checkpoint(checkpoint_key) if checkpoint_key else {}
+        if completed:
+            log.log(f"Resuming: {len(completed)} batches already transcribed.")
+
+        def batch_done(start, batch_result):
+            if checkpoint_key:
                 try:
-                    result = transcribe_audio(batch_output)
-                    # Clean up batch file
-                    os.remove(batch_output)
-                    
-                    batch_process_end = time.time()
-                    print(f"Batch starting at {start} sec completed in {batch_process_end - batch_process_start:.2f} seconds")
-                except Exception as e:
-                    print(f"Error processing batch starting at {start} sec: {str(e)}")
-            else:
-                print(f"Error: Batch file {batch_output} was not created")
-            
-            return start, result
+                    append_batch_checkpoint(checkpoint_key, start, batch_result)
+                except OSError as e:
+                    log.log(f"Error checkpointing batch at {start} sec: {str(e)}")
+            if on_batch:
+                on_batch(start, batch_result)
 
-        # Process batches concurrently
-        starts = list(range(0, int(total_duration), int(batch_duration)))
-        results = []
-        with ThreadPoolExecutor() as executor:
-            futures = {executor.submit(process_batch, start): start for start in starts}
-            for future in as_completed(futures):
-                start, batch_result = future.result()
-                if batch_result:
-                    results.append((start, batch_result))
+        # Process batches concurrently, at most max_workers in flight
+        results = asyncio.run(_transcribe_batches_async(
+            file_path, total_duration, batch_duration, max_workers, batch_done, completed, on_batch
+        ))
+        # Batches that failed for good; their audio is not in the transcript.
+        missing = [start for start, batch_result in results if not batch_result]
+        # Keep the checkpoint while any batch is missing so a retry can resume.
+        if checkpoint_key and not missing:
+            remove_batch_checkpoint(checkpoint_key)
         
-        # Sort results by start time and compile full transcription
-        results.sort(key=lambda x: x[0])
+        # Compile full transcription in batch order
         for start, batch_result in results:
             if batch_result:
-                full_transcription["text"] += batch_result["text"] + " "
-                if "chunks" in batch_result:
-                    for chunk in batch_result["chunks"]:
-                        chunk['start'] += start
-                        chunk['end'] += start
-                        full_transcription["chunks"].append(chunk)
+                text_parts.append(batch_result["text"])
+                full_transcription["chunks"].extend(offset_chunks(batch_result.get("chunks", []), start))
+        # Joined once at the end instead of growing one string batch by batch.
+        full_transcription["text"] = " ".join(text_parts)
+        if missing:
+            full_transcription["incomplete"] = True
+            full_transcription["missing_batches"] = missing
+            log.log(f"Transcript is incomplete: {len(missing)} of {len(results)} batches failed.")
         
         total_batch_time = time.time() - batch_start_time
-        print(f"\nTotal batch processing time: {total_batch_time:.2f} seconds")
-        print(f"Average time per batch: {total_batch_time/total_batches:.2f} seconds")
+        log.log(f"Total batch processing time: {total_batch_time:.2f} seconds")
+        log.log(f"Average time per batch: {total_batch_time/total_batches:.2f} seconds")
         
         return full_transcription
     except Exception as e:
-        print(f"Batch processing error: {str(e)}")
+        log.log(f"Batch processing error: {str(e)}")
         return None
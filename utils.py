@@ -1,7 +1,10 @@
 # utils.py
+import functools
+import hashlib
+import os
 import re
 import unicodedata
-from datetime import datetime
+from datetime import datetime, timedelta
 
 def get_metadata(info_dict: dict) -> dict:
     """Extract metadata from yt-dlp info dictionary."""
@@ -20,18 +23,95 @@ def get_metadata(info_dict: dict) -> dict:
         }
     }
 
+def format_time(seconds) -> str:
+    """Format a number of seconds as H:MM:SS."""
+    return str(timedelta(seconds=int(seconds))).split('.')[0]
+
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+def format_size(num_bytes) -> str:
+    """
+    Format a byte count with a binary (1024-based) unit, e.g. '12.3 MB'.
+    The unit index comes straight from the integer's bit length (floor(log2))
+    instead of a divide-by-1024 loop. Speeds may be floats; they are
+    truncated to whole bytes first.
+    """
+    num_bytes = int(num_bytes)
+    if num_bytes < 1:
+        return "0 B"
+    unit = min((num_bytes.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    if unit == 0:
+        return f"{num_bytes} B"
+    return f"{num_bytes / (1 << (unit * 10)):.1f} {_SIZE_UNITS[unit]}"
+
+def get_chunk_times(chunk: dict) -> tuple:
+    """
+    Return (start, end) of a transcript chunk in seconds.
+    Wizper reports them as a 'timestamp' pair; 'start'/'end' keys are also accepted.
+    """
+    if 'timestamp' in chunk:
+        start, end = chunk['timestamp']
+        return start, end
+    return chunk.get('start'), chunk.get('end')
+
+def offset_chunks(chunks: list, offset: float):
+    """
+    Yield copies of transcript chunks with their times moved by offset seconds,
+    keeping each chunk's layout ('timestamp' pair or 'start'/'end' keys).
+    Missing times (None) are left as they are.
+    """
+    for chunk in chunks:
+        start, end = get_chunk_times(chunk)
+        start = start + offset if start is not None else None
+        end = end + offset if end is not None else None
+        if 'timestamp' in chunk:
+            yield {**chunk, 'timestamp': [start, end]}
+        else:
+            yield {**chunk, 'start': start, 'end': end}
+
+def chunks_to_columns(chunks: list) -> dict:
+    """
+    Return transcript chunks as columns: {'start': [...], 'end': [...], 'text': [...]}.
+    One list per field instead of one dict per chunk, which is what tabular
+    consumers such as st.dataframe want.
+    """
+    times = [get_chunk_times(chunk) for chunk in chunks]
+    return {
+        "start": [start for start, _ in times],
+        "end": [end for _, end in times],
+        "text": [chunk.get("text", "") for chunk in chunks],
+    }
+
+def get_model_meta(result: dict) -> dict:
+    """
+    Return the fields of a transcription result other than its text and chunks,
+    which are stored separately and would otherwise be duplicated.
+    """
+    return {k: v for k, v in result.items() if k not in ('text', 'chunks')}
+
+# Patterns used by sanitize_filename, compiled once at import.
+_PODCAST_PATH_RE = re.compile(r'\/podcast\/')
+_PODCAST_ID_RE = re.compile(r'id\d+')
+# After the ASCII round-trip only ASCII is left, so the characters r'[^\w\s-]'
+# would remove can be deleted with a single str.translate instead.
+_UNSAFE_CHARS_TABLE = str.maketrans('', '', ''.join(
+    c for c in map(chr, range(128)) if not (c.isalnum() or c.isspace() or c in '_-')
+))
+_WHITESPACE_RE = re.compile(r'\s+')
+
+@functools.lru_cache(maxsize=1024)
 def sanitize_filename(filename: str) -> str:
     """
     Sanitize filename to handle special characters and encoding issues.
     """
-    filename = re.sub(r'\/podcast\/', '', filename)
-    filename = re.sub(r'id\d+', '', filename)
+    filename = _PODCAST_PATH_RE.sub('', filename)
+    filename = _PODCAST_ID_RE.sub('', filename)
     filename = filename.split('?')[0]
     filename = filename.split('/')[-1]
     filename = unicodedata.normalize('NFKD', filename)
     filename = filename.encode('ASCII', 'ignore').decode('ASCII')
-    filename = re.sub(r'[^\w\s-]', '', filename)
-    filename = re.sub(r'\s+', '_', filename.strip())
+    filename = filename.translate(_UNSAFE_CHARS_TABLE)
+    filename = _WHITESPACE_RE.sub('_', filename.strip())
     return filename
 
 def get_episode_name(url: str, fallback_title: str = None) -> str:
@@ -39,7 +119,7 @@ def get_episode_name(url: str, fallback_title: str = None) -> str:
     Extract episode name from URL or use the fallback title.
     """
     try:
-        if 'podcast' in url:
+        if url and 'podcast' in url:
             path = url.split('/')
             for segment in path:
                 if len(segment) > 10:
@@ -51,3 +131,34 @@ def get_episode_name(url: str, fallback_title: str = None) -> str:
         return 'transcript'
     except Exception as e:
         raise e
+
+def stat_or_none(path: str):
+    """
+    Return os.stat(path), or None if the file does not exist.
+    One syscall answers both "does it exist" and "how big is it".
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+# Bytes hashed from each end of a file by audio_fingerprint.
+FINGERPRINT_SAMPLE_SIZE = 1024 * 1024
+
+def audio_fingerprint(path: str) -> str:
+    """
+    Return a cache key for an audio file: a BLAKE2b digest of its size plus
+    its first and last FINGERPRINT_SAMPLE_SIZE bytes.
+    Only ~2 MB is read however long the episode is; the size and both ends
+    (container headers and trailing frames) are enough to tell downloads apart.
+    """
+    size = os.stat(path).st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+        if size > 2 * FINGERPRINT_SAMPLE_SIZE:
+            f.seek(-FINGERPRINT_SAMPLE_SIZE, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+        elif size > FINGERPRINT_SAMPLE_SIZE:
+            digest.update(f.read())
+    return digest.hexdigest()